@@ -0,0 +1,87 @@
+'''
+Offline tool which builds an opening book for the pillar game.
+
+It deals many random openings and, for each position of their first turns, plays out every legal action
+of the acting agent with Monte-Carlo rollouts (see rollout.py). Positions are keyed by their canonical state
+and the team's hand, so positions equivalent by symmetry or team swap pool their playouts.
+The book keeps, for each position, the action with the best mean score among the actions played out at least
+min_plays times. During the build, gamers play that best action, so later turns follow the book's own play.
+The resulting book can then be given to GameModel(..., opening_book="book.bin").
+
+Usage example:
+python build_opening_book.py --grid_size 5 --num_gamers_per_team 2 --max_pillar_height 5 --positions 200 book.bin
+'''
+import argparse
+import contextlib
+import os
+
+import rollout
+from game_model import GameModel, OpeningBook
+
+def recorded_rollout_AI(agent, stats):
+    '''
+    Replaces a GamerAgent's rollout_AI method : the score of each legal action is added to
+    stats[state key][(card, canonical cell)] = [total score, plays], then the best action is played.
+    '''
+    def wrapper():
+        model=agent.model
+        width=model.grid.width
+        # step() has drawn the hand and updated the agent's height : this is the position the agent chooses from.
+        state, symmetry = model.canonical_symmetry(team=agent.team, agent=agent, with_hand=True)
+        action_stats=stats.setdefault(OpeningBook.hash_state(state), {})
+        candidates, scores = agent.rollout_candidates()
+        for (code, cell), score in zip(candidates, scores):
+            if cell != rollout.NO_CELL : cell=symmetry((cell%width, cell//width))
+            else : cell=None
+            total=action_stats.setdefault((model.rollout_cards[code], cell), [0.0, 0])
+            total[0]+=score*model.rollout_playouts
+            total[1]+=model.rollout_playouts
+        best_score=max(scores)
+        return(agent.play_rollout_candidate(agent.random.choice([candidate for candidate, score in zip(candidates, scores)
+                                                                   if score == best_score])))
+    return(wrapper)
+
+def best_actions(stats, min_plays):
+    '''Returns {state key: (card, cell)}, the action with the best mean score of each position among those played min_plays times.'''
+    actions={}
+    for key, action_stats in stats.items():
+        played={action: score/plays for action, (score, plays) in action_stats.items() if plays >= min_plays}
+        if played:
+            actions[key]=max(played, key=played.get)
+    return(actions)
+
+def build_opening_book(args):
+    stats={} # key -> {(card, cell): [score, plays]}
+    # A single model is reset in place for every opening, its gamers keep their recording rollout_AI.
+    model=GameModel(args.num_gamers_per_team, args.grid_size, args.grid_size, False, "ROLLOUT", "ROLLOUT",
+                    max_pillar_height=args.max_pillar_height, seed=args.seed, rollout_playouts=args.playouts,
+                    rollout_policy=args.policy, rollout_workers=args.workers)
+    for agent in model.gamers:
+        agent.rollout_AI=recorded_rollout_AI(agent, stats)
+    for position in range(args.positions):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if position > 0 : model.reset()
+            while model.running and model.schedule.steps < args.turns:
+                model.step()
+        if (position+1) % 100 == 0 : print("Played", position+1, "openings,", len(stats), "positions seen.")
+    return(OpeningBook.from_actions(best_actions(stats, args.min_plays), model.configuration(), args.turns))
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Build an opening book for the pillar game.")
+    parser.add_argument("output", help="Path of the book file.")
+    parser.add_argument("--grid_size", type=int, default=5)
+    parser.add_argument("--num_gamers_per_team", type=int, default=2)
+    parser.add_argument("--max_pillar_height", type=int, default=5)
+    parser.add_argument("--positions", type=int, default=1000, help="Number of random openings to play out.")
+    parser.add_argument("--turns", type=int, default=1, help="Number of opening turns recorded in the book.")
+    parser.add_argument("--playouts", type=int, default=32, help="Playouts of each legal action, each time a position is seen.")
+    parser.add_argument("--policy", default="REACTIVE", choices=["RANDOM", "REACTIVE"], help="Behaviour of the gamers during playouts.")
+    parser.add_argument("--workers", type=int, default=None, help="Playout worker processes, one per CPU by default.")
+    parser.add_argument("--min_plays", type=int, default=32, help="Minimum number of playouts of an action to keep it.")
+    parser.add_argument("--seed", type=int, default=None)
+    args=parser.parse_args()
+
+    if args.grid_size % 2 == 0 or args.grid_size < 5 : parser.error("Grid size must be an odd number >= 5.")
+    book=build_opening_book(args)
+    book.save(args.output)
+    print("Saved an opening book of", len(book), "positions to", args.output)
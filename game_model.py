@@ -3,6 +3,12 @@ import enum
 from enum import Enum
 import numpy as np
 import random
+import hashlib
+import ast
+import os
+from operator import itemgetter
+
+import rollout
 
 def rgb_to_hex(r,g,b):
     return('#%02x%02x%02x' % (r,g,b))
@@ -36,6 +42,29 @@ def closest_cells_to_target(cell_list, target_cell):
             closest_cells.append(cell)
     return(closest_cells)
 
+def board_symmetries(width, height):
+    '''
+    Returns the symmetries of the board as functions mapping a (x,y) cell to its image.
+    A square board has the 8 dihedral symmetries (rotations and reflections).
+    A rectangular board only keeps the 4 which don't swap the x and y axes.
+    The identity is always the first symmetry.
+    '''
+    w, h = width-1, height-1
+    symmetries=[lambda cell: (cell[0], cell[1]),
+                lambda cell: (w-cell[0], cell[1]),
+                lambda cell: (cell[0], h-cell[1]),
+                lambda cell: (w-cell[0], h-cell[1])]
+    if width == height:
+        symmetries+=[lambda cell: (cell[1], cell[0]),
+                     lambda cell: (h-cell[1], cell[0]),
+                     lambda cell: (cell[1], w-cell[0]),
+                     lambda cell: (h-cell[1], w-cell[0])]
+    return(symmetries)
+
+def inverse_symmetry(symmetry, cell):
+    '''Applies the inverse of a board symmetry to a cell. Every board symmetry s verifies s^4 = identity.'''
+    return(symmetry(symmetry(symmetry(cell))))
+
 class Color(Enum):
     RED = enum.auto(),
     BLUE = enum.auto()
@@ -44,11 +73,42 @@ class AI(Enum):
     RANDOM = enum.auto()
     REACTIVE = enum.auto()
     UTILITY = enum.auto()
+    ROLLOUT = enum.auto()
 
 class Card(Enum):
     MOVE = enum.auto(),
     BUILD_PILLAR = enum.auto()
 
+class RuleSet:
+    """
+    A variant of the rules of the game. The default RuleSet is the original game.
+    - deck : number of copies of each card per gamer in a team's deck.
+    - moore : if True, gamers move and build on the 8 surrounding cells (Moore neighborhood)
+      instead of the 4 adjacent cells (von Neumann neighborhood).
+    - max_climb, max_drop : how much higher or lower than its own pillar a gamer can move in one move.
+    - max_build_height : pillars can't be built higher than this. None means max_pillar_height-1.
+    - goals : list of the (x,y) cells of the goal pillars, which are of max_pillar_height.
+      A team wins when one of its gamers stands on a goal. None means the center cell.
+    Rules which can never be won (no MOVE card, or max_build_height + max_climb < max_pillar_height) are rejected by the GameModel.
+    A GameModel compiles its rules into legality tables (see GameModel.compile_rules()),
+    so every AI checks a variant's rules as fast as the original ones.
+    """
+    def __init__(self, deck=None, moore=False, max_climb=1, max_drop=1, max_build_height=None, goals=None):
+        if deck is None : deck={Card.MOVE: 1, Card.BUILD_PILLAR: 1}
+        if sum(deck.values()) < 1 : raise(ValueError("A deck must have at least one card per gamer."))
+        self.deck={card: copies for card, copies in deck.items() if copies > 0}
+        self.moore=moore
+        self.max_climb=max_climb
+        self.max_drop=max_drop
+        self.max_build_height=max_build_height
+        self.goals=sorted(set(map(tuple, goals))) if goals is not None else None # the order of the goals doesn't matter.
+
+    def signature(self):
+        '''Hashable description of the rules. Equal rules have equal signatures, whatever the order of the deck and of the goals.'''
+        return((tuple(sorted((card.name, copies) for card, copies in self.deck.items())), self.moore, self.max_climb, self.max_drop,
+                self.max_build_height, tuple(self.goals) if self.goals is not None else None))
+
+
 class Message:
     """
     Messages are sent by gamer agents to the team.message_pile.
@@ -71,24 +131,29 @@ class Team:
     The team class also manages team messages and team initiative.
     The agents belonging to a team are all represented in its initiative queue.
     """
-    def __init__(self,color=Color.RED,hand_size=3,ai="RANDOM", player=False):
+    def __init__(self,color=Color.RED,hand_size=3,ai="RANDOM", player=False, rng=random):
         self.color=color
+        self.random=rng # random generator used to shuffle the deck, the model's one.
         self.hand_size=hand_size
         self.deck=[] #list of cards
         self.hand=[] #list of cards
         self.discard=[] #list of cards
-        if ai == "RANDOM" : self.ai = AI.RANDOM
-        if ai == "REACTIVE" : self.ai = AI.REACTIVE
-        if ai == "UTILITY" : self.ai = AI.UTILITY
+        self.set_ai(ai)
         self.player = player
         self.message_pile=[] #pile of Messages
         self.initiative_queue=[] # Queue of agents
+
+    def set_ai(self, ai):
+        if ai == "RANDOM" : self.ai = AI.RANDOM
+        if ai == "REACTIVE" : self.ai = AI.REACTIVE
+        if ai == "UTILITY" : self.ai = AI.UTILITY
+        if ai == "ROLLOUT" : self.ai = AI.ROLLOUT
     
     def shuffle_deck_from_discard(self):
         print("Team ", self.color, " is shuffling their deck from their discard pile!")
         while len(self.discard) != 0:
             self.deck.append(self.discard.pop())
-        random.shuffle(self.deck)
+        self.random.shuffle(self.deck)
 
     def draw_new_hand(self):
         print("Team ", self.color, " is drawing a new hand from their deck!")
@@ -121,6 +186,87 @@ class Team:
         self.initiative_queue.insert(0,agent)
 
 
+class OpeningBook:
+    """
+    An opening book maps early positions to the action which scored best from them.
+    It is built offline by build_opening_book.py.
+
+    Positions are identified by a 64 bit hash of their canonical state seen from the acting agent
+    (see GameModel.canonical_symmetry(), with the agent and the team's hand).
+    Actions are a card and a cell in canonical coordinates, or a card and no cell when the card is
+    used as an initiative setter.
+
+    The book is consulted during the first max_turns turns of a game, and is only valid for the
+    configuration it was built with (see GameModel.configuration()).
+    Both are written in the header of the book file. The entries follow the header as a numpy array sorted by key.
+    Loading a book memory-maps its entries, so only the pages touched by lookups are read from disk.
+    """
+    dtype=np.dtype([("key", "<u8"), ("card", "u1"), ("x", "i1"), ("y", "i1")])
+    cards=list(Card)
+    magic=b"PILLAR OPENING BOOK 1\n"
+    alignment=16 # The entries start on a multiple of this offset.
+
+    def __init__(self, entries, configuration, max_turns):
+        self.entries=entries
+        self.configuration=configuration
+        self.max_turns=max_turns
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            if file.readline() != cls.magic:
+                raise ValueError(path+" is not an opening book.")
+            header=ast.literal_eval(file.readline().decode().strip())
+            offset=file.tell()
+        if header["entries"] == 0 : entries=np.zeros(0, dtype=cls.dtype) # an empty file can't be memory-mapped.
+        else : entries=np.memmap(path, dtype=cls.dtype, mode="r", offset=offset, shape=(header["entries"],))
+        return(cls(entries, header["configuration"], header["max_turns"]))
+
+    @classmethod
+    def from_actions(cls, actions, configuration, max_turns):
+        '''Builds a book from a {key: (card, cell)} dictionnary.'''
+        entries=np.zeros(len(actions), dtype=cls.dtype)
+        for i, key in enumerate(sorted(actions)):
+            card, cell = actions[key]
+            if cell is None : cell=(-1,-1)
+            entries[i]=(key, cls.cards.index(card), cell[0], cell[1])
+        return(cls(entries, configuration, max_turns))
+
+    def save(self, path):
+        header=repr({"max_turns": self.max_turns, "configuration": self.configuration, "entries": len(self.entries)}).encode()
+        padding=-(len(self.magic)+len(header)+1) % self.alignment
+        with open(path, "wb") as file:
+            file.write(self.magic + header + b" "*padding + b"\n")
+            file.write(np.ascontiguousarray(self.entries, dtype=self.dtype).tobytes())
+
+    def check_configuration(self, configuration):
+        '''Raises a ValueError if the book was built for another configuration than the given one.'''
+        if configuration != self.configuration:
+            raise ValueError("The opening book was built for the configuration "+repr(self.configuration)+
+                             ", not "+repr(configuration)+" (team size, width, height, pillar height, rules).")
+
+    @staticmethod
+    def hash_state(state):
+        '''Stable 64 bit hash of a canonical state. (Python's hash() of strings changes between runs.)'''
+        digest=hashlib.blake2b(repr(state).encode(), digest_size=8).digest()
+        return(int.from_bytes(digest, "little"))
+
+    def lookup(self, state):
+        '''Returns the (card, cell) action for a canonical state, or None if the position isn't in the book.'''
+        key=self.hash_state(state)
+        keys=self.entries["key"]
+        index=int(np.searchsorted(keys, np.uint64(key)))
+        if index == len(keys) or int(keys[index]) != key:
+            return None
+        entry=self.entries[index]
+        cell=(int(entry["x"]), int(entry["y"]))
+        if cell == (-1,-1) : cell=None
+        return(self.cards[int(entry["card"])], cell)
+
+    def __len__(self):
+        return(len(self.entries))
+
+
 class PillarAgent(mesa.Agent):
     """
     A pillar "agent".
@@ -224,7 +370,7 @@ class GamerAgent(mesa.Agent):
         '''
         Basic agent action which corresponds to moving the agent to a cell.
         Usually, an agent cannot move into a cell if there already is an agent in the cell,
-        or if the vertical (height) distance to the cell is higher than 1.
+        or if the vertical (height) distance to the cell is higher than 1. (See RuleSet.max_climb and RuleSet.max_drop.)
 
         cell is a (x,y) tuple.
         You can set the 'test' parameter to True to test if this action can be made or not.
@@ -232,7 +378,7 @@ class GamerAgent(mesa.Agent):
         '''
         cell_content=self.model.grid.grid[cell[0]][cell[1]]
         if not any(isinstance(agent,GamerAgent) for agent in cell_content): # Si il n'y a pas un agent dans la cell
-            if diff(self.height, self.model.pillars[cell[0]][cell[1]].height) <= 1: # et si le pillier correspondant est à une distance inférieure à 1
+            if self.model.can_move_height[self.height][self.model.pillars[cell[0]][cell[1]].height]: # et si le pillier correspondant n'est pas trop haut ou trop bas
                 if not test : self.model.grid.move_agent(self, cell)
                 return(True)
             if raise_errors: raise(Exception("Pillar is too far away."))
@@ -243,7 +389,7 @@ class GamerAgent(mesa.Agent):
         '''
         Basic agent action which corresponds to building up a pillar in a cell.
         Usually, an agent cannot build up a pillar in a cell if there already is an agent in the cell,
-        or if the pillar would be built higher than self.model.max_pillar_height-1.
+        or if the pillar would be built higher than self.model.max_pillar_height-1. (See RuleSet.max_build_height.)
         (Only the center pillar is of max_pillar height.)
         
         cell is a (x,y) tuple.
@@ -252,7 +398,7 @@ class GamerAgent(mesa.Agent):
         '''
         cell_content=self.model.grid.grid[cell[0]][cell[1]]
         if not any(isinstance(agent,GamerAgent) for agent in cell_content): # Si il n'y a pas un agent dans la cell
-            if self.model.pillars[cell[0]][cell[1]].height<self.model.max_pillar_height-1: #On ne peut pas construire un pillier plus haut que max_pillar_height-1
+            if self.model.can_build_height[self.model.pillars[cell[0]][cell[1]].height]: #On ne peut pas construire un pillier plus haut que max_build_height
                 if not test : self.model.pillars[cell[0]][cell[1]].height+=1
                 return(True)
             if raise_errors: raise(Exception("Pillar is too tall to build up."))
@@ -299,7 +445,7 @@ class GamerAgent(mesa.Agent):
 
         If there are no available options, it sets initiative to 0 instead.
         '''
-        neighborhood_cells = self.model.grid.get_neighborhood(self.pos,moore=False, include_center=False) # Moore = avec diagonales. 
+        neighborhood_cells = self.model.neighborhood(self.pos)
         available_moves = []
         for cell in neighborhood_cells: # Les "cell" retournées sont des tuples de pos.
             if self.move_action(cell, test=True):
@@ -319,7 +465,7 @@ class GamerAgent(mesa.Agent):
 
         If there are no available options, it sets initiative to 0 instead.
         '''
-        neighborhood_cells = self.model.grid.get_neighborhood(self.pos,moore=False, include_center=False) # Moore = avec diagonales. 
+        neighborhood_cells = self.model.neighborhood(self.pos)
         available_cells = []
         for cell in neighborhood_cells: # Les "cell" retournées sont des tuples de pos.
             if self.build_pillar_action(cell, test=True):
@@ -356,12 +502,17 @@ class GamerAgent(mesa.Agent):
         
         blocked = True
         
-        neighborhood_cells = self.model.grid.get_neighborhood(self.pos,moore=False, include_center=False)
+        neighborhood_cells = self.model.neighborhood(self.pos)
         for cell in neighborhood_cells:
             if ((Card.BUILD_PILLAR in self.team.hand and self.build_pillar_action(cell, test=True)) or 
                     (Card.MOVE in self.team.hand and self.move_action(cell, test=True))):
                 blocked = False
         
+        # (dx,dy) of each direction the command can give, diagonals included when the rules use the Moore neighborhood.
+        directions = {"up": (0,1), "down": (0,-1), "left": (-1,0), "right": (1,0)}
+        if self.model.rules.moore:
+            directions.update({"up-left": (-1,1), "up-right": (1,1), "down-left": (-1,-1), "down-right": (1,-1)})
+
         if blocked == False:
         # get the command from the player
             while True:
@@ -370,7 +521,7 @@ class GamerAgent(mesa.Agent):
                 print("Your current pawn is on column", self.pos[0]+1, "and line", self.model.grid.height - self.pos[1],".")
                 # get the command from user
                 try:
-                    action, direction = str(input("Enter your action with format (move/build) + (up/down/left/right), or (no action) to play first in the next round: ")).split()
+                    action, direction = str(input("Enter your action with format (move/build) + ("+"/".join(directions)+"), or (no action) to play first in the next round: ")).split()
                 except :
                     print("Invalid command, enter a chain of characters.\n")
                     continue
@@ -395,13 +546,11 @@ class GamerAgent(mesa.Agent):
                                 print("Invalid command, you must choose between available cards.\n")
                         
                     # if invalid set of commands
-                    if(not action.lower() in ["move", "build"] or not direction.lower() in ["up", "down", "left", "right"]):
+                    if(not action.lower() in ["move", "build"] or not direction.lower() in directions):
                         print("Invalid command, enter command with the given format.\n")
                         continue
-                    if direction.lower() == "up": intended_cell = (self.pos[0], self.pos[1]+1)
-                    elif direction.lower() == "down": intended_cell = (self.pos[0], self.pos[1]-1)
-                    elif direction.lower() == "left": intended_cell = (self.pos[0]-1, self.pos[1])
-                    else : intended_cell = (self.pos[0]+1, self.pos[1])
+                    dx, dy = directions[direction.lower()]
+                    intended_cell = (self.pos[0]+dx, self.pos[1]+dy)
                     
                     # if given cell out of bounds
                     if self.model.grid.out_of_bounds(intended_cell) :
@@ -431,7 +580,7 @@ class GamerAgent(mesa.Agent):
         if t == "foes" : team = self.get_foes()
         else : team = self.get_allies()
         for agent in team:
-            neighborhood_cells = self.model.grid.get_neighborhood(agent.pos,moore=False, include_center=False)
+            neighborhood_cells = self.model.neighborhood(agent.pos)
             for cell in neighborhood_cells:
                 if agent.move_action(cell, test=True) and self.model.pillars[cell[0]][cell[1]].height - agent.height == 1 and cell not in advantageous_cells: 
                     advantageous_cells.append(cell)
@@ -442,21 +591,22 @@ class GamerAgent(mesa.Agent):
         if t == "foes" : team = self.get_foes()
         else : team = self.get_allies()
         for agent in team:
-            neighborhood_cells = self.model.grid.get_neighborhood(agent.pos,moore=False, include_center=False)
+            neighborhood_cells = self.model.neighborhood(agent.pos)
             for cell in neighborhood_cells:
                 if agent.build_pillar_action(cell, test=True) and self.model.pillars[cell[0]][cell[1]].height - agent.height == 0 and cell not in upgradable_cells: 
                     upgradable_cells.append(cell)
         return len(upgradable_cells)    
     
     def distance_center(self):
-        return (abs(self.pos[0] - self.model.grid.width//2) + abs(self.pos[1] - self.model.grid.height//2))
+        '''Distance to the closest goal pillar. (The center pillar in the original rules.)'''
+        return (min(tuple_dist(self.pos, goal) for goal in self.model.goals))
     
     def count_blocking_cells(self, t="default"):
         blocking_cells=[]
         if t == "foes" : team = self.get_foes()
         else : team = self.get_allies()
         for agent in team:
-            neighborhood_cells = self.model.grid.get_neighborhood(agent.pos,moore=False, include_center=False)
+            neighborhood_cells = self.model.neighborhood(agent.pos)
             for cell in neighborhood_cells:
                 if not agent.move_action(cell, test=True) and cell not in blocking_cells: 
                     blocking_cells.append(cell)
@@ -470,7 +620,7 @@ class GamerAgent(mesa.Agent):
                 - w_center_A * self.distance_center()
                 - w_block_A * self.count_blocking_cells() + w_block_F * self.count_blocking_cells(t = "foes")
                 )
-    
+
     def utility_AI(self):
         '''
         Reacts according to a utility function, designed to maximise allies' height, the number of cells that
@@ -478,7 +628,7 @@ class GamerAgent(mesa.Agent):
         the distance to the center (vice-versa with these features for the opponents)
         '''
         
-        neighborhood_cells = self.model.grid.get_neighborhood(self.pos,moore=False, include_center=False)
+        neighborhood_cells = self.model.neighborhood(self.pos)
         best_utility = float('-inf')
         best_cell = neighborhood_cells[0]
         best_action = "move"
@@ -524,8 +674,8 @@ class GamerAgent(mesa.Agent):
         '''
         chosen_card=None
 
-        neighborhood_cells = self.model.grid.get_neighborhood(self.pos,moore=False, include_center=False)
-        center_cell = (self.model.grid.width//2, self.model.grid.height//2)
+        neighborhood_cells = self.model.neighborhood(self.pos)
+        center_cell = min(self.model.goals, key=lambda goal: tuple_dist(self.pos, goal)) # closest goal pillar
 
         advantageous_cells=[]
         for cell in neighborhood_cells:
@@ -572,6 +722,79 @@ class GamerAgent(mesa.Agent):
         
         return(chosen_card)
 
+    def rollout_candidates(self):
+        '''
+        Returns the legal actions, as (card code, cell index) candidates (see rollout.py),
+        and the mean score of each over self.model.rollout_playouts playouts.
+        '''
+        to_code={card: code for code, card in enumerate(self.model.rollout_cards)}
+        width=self.model.grid.width
+        candidates=[]
+        for card in [card for card in self.model.rollout_cards if card in self.team.hand]:
+            for cell in self.model.neighborhood(self.pos):
+                if ((card==Card.MOVE and self.move_action(cell, test=True)) or
+                        (card==Card.BUILD_PILLAR and self.build_pillar_action(cell, test=True))):
+                    candidates.append((to_code[card], cell[0]+cell[1]*width))
+            candidates.append((to_code[card], rollout.NO_CELL))
+        scores=rollout.evaluate_candidates(self.model.rollout_state(self), self.model.rollout_tables, candidates,
+                                           playouts=self.model.rollout_playouts, policy=self.model.rollout_policy,
+                                           workers=self.model.rollout_workers, seed=self.random.getrandbits(32))
+        return(candidates, scores)
+
+    def play_rollout_candidate(self, candidate):
+        '''Plays a (card code, cell index) candidate from rollout_candidates(). Returns the card played.'''
+        code, cell = candidate
+        width=self.model.grid.width
+        chosen_card=self.model.rollout_cards[code]
+        if cell == rollout.NO_CELL:
+            self.use_card_as_initiative_setter()
+        elif chosen_card==Card.MOVE:
+            self.move_action((cell%width, cell//width), raise_errors=True)
+        else:
+            self.build_pillar_action((cell%width, cell//width), raise_errors=True)
+        return(chosen_card)
+
+    def rollout_AI(self):
+        '''
+        Monte-Carlo rollout AI.
+        Every legal action (each card in the hand, on each cell it can be used on, or as an initiative setter)
+        is played then followed by self.model.rollout_playouts fast playouts to the end of the game,
+        in which every gamer plays with the self.model.rollout_policy behaviour (RANDOM or REACTIVE).
+        The action with the best win rate is chosen. See rollout.py.
+        '''
+        candidates, scores = self.rollout_candidates()
+        best_score=max(scores)
+        return(self.play_rollout_candidate(self.random.choice([candidate for candidate, score in zip(candidates, scores) if score == best_score])))
+
+    def opening_book_action(self):
+        '''
+        Plays the action the model's opening book gives for the current position.
+        The book's action is mapped back from canonical coordinates, and is only played if it is still legal.
+        Returns the chosen card, or None if there is no book, the game is past the opening,
+        or the position isn't in the book. The team's AI must then choose the action.
+        '''
+        book=self.model.opening_book
+        if book is None or self.model.schedule.steps >= book.max_turns:
+            return None
+        state, symmetry = self.model.canonical_symmetry(team=self.team, agent=self, with_hand=True)
+        action=book.lookup(state)
+        if action is None or action[0] not in self.team.hand:
+            return None
+        card, cell = action
+        if cell is None:
+            self.use_card_as_initiative_setter()
+            return(card)
+        cell=inverse_symmetry(symmetry, cell)
+        if cell not in self.model.neighborhood(self.pos):
+            return None
+        if card==Card.MOVE and self.move_action(cell, test=True):
+            self.move_action(cell)
+            return(card)
+        if card==Card.BUILD_PILLAR and self.build_pillar_action(cell, test=True):
+            self.build_pillar_action(cell)
+            return(card)
+        return None
+
     def step(self):
         self.update_height()
         self.update_initiative() #initiative has no practical purpose, but it could be used by an AI as additionnal info idk.
@@ -583,9 +806,12 @@ class GamerAgent(mesa.Agent):
 
         chosen_card=None
         if self.team.player == True : chosen_card=self.player()
-        elif self.team.ai==AI.RANDOM: chosen_card=self.random_AI()        
-        elif self.team.ai==AI.REACTIVE: chosen_card=self.reactive_AI()
-        elif self.team.ai==AI.UTILITY: chosen_card=self.utility_AI()
+        else : chosen_card=self.opening_book_action() # None if the position isn't in the opening book.
+        if chosen_card is None:
+            if self.team.ai==AI.RANDOM: chosen_card=self.random_AI()
+            elif self.team.ai==AI.REACTIVE: chosen_card=self.reactive_AI()
+            elif self.team.ai==AI.UTILITY: chosen_card=self.utility_AI()
+            elif self.team.ai==AI.ROLLOUT: chosen_card=self.rollout_AI()
 
         self.team.discard_card(chosen_card)
         self.check_win_condition()
@@ -615,9 +841,17 @@ class GameModel(mesa.Model):
     You can access grid cell content using self.grid.grid[x][y].
     A grid cell will contain a pillar and a certain amount of players (0-1)
     A pillar in a cell will generally be self.grid.grid[x][y][0], but you can directly access the pillar info using self.pillars[x][y].
+
+    Variants of the rules can be played by giving a RuleSet.
+    The rollout_ parameters set up the ROLLOUT AI, see GamerAgent.rollout_AI().
     """
+    rollout_cards=(Card.MOVE, Card.BUILD_PILLAR) # Cards of the card codes used by rollout.py
 
-    def __init__(self, num_gamers_per_team, width, height, player, AI1_behaviour, AI2_behaviour, max_pillar_height=7):
+    def __init__(self, num_gamers_per_team, width, height, player, AI1_behaviour, AI2_behaviour, max_pillar_height=7,
+                 opening_book=None, seed=None, rules=None, rollout_playouts=32, rollout_policy="REACTIVE", rollout_workers=None):
+        # mesa's Model.__new__ stores its random generator on the class, which would be shared by every model.
+        self.random = random.Random(seed)
+        self._seed = seed
         self.grid = mesa.space.MultiGrid(width, height, False)
         self.schedule = mesa.time.BaseScheduler(self) # Sequential scheduler.
         self.running = True
@@ -626,41 +860,126 @@ class GameModel(mesa.Model):
         self.AI2_behaviour = AI2_behaviour
         self.num_gamers_per_team = num_gamers_per_team
         self.max_pillar_height=max_pillar_height
+        self.rollout_playouts=rollout_playouts
+        self.rollout_policy=rollout_policy
+        self.rollout_workers=rollout_workers # None for one worker process per CPU, 0 or 1 to play out in this process.
+        self.rules=rules if rules is not None else RuleSet()
+        self.compile_rules()
         self.teams=self.init_teams(AIs=[AI1_behaviour, AI2_behaviour], player=player)
         self.pillars=self.init_pillars()
         self.init_gamerAgents()
+        self.set_opening_book(opening_book)
         
         self.datacollector = mesa.DataCollector(
             model_reporters={},
             agent_reporters={}
         )
 
+    def configuration(self):
+        '''The settings a game can't be reset without: team size, grid size, pillar height and rules.'''
+        return((self.num_gamers_per_team, self.grid.width, self.grid.height, self.max_pillar_height, self.rules.signature()))
+
+    def set_opening_book(self, opening_book):
+        '''
+        Sets the OpeningBook, see GamerAgent.opening_book_action(). opening_book can also be the path of a book file, or None.
+        Raises a ValueError if the book was built for another configuration.
+        '''
+        if isinstance(opening_book, str) : opening_book=OpeningBook.load(opening_book)
+        if opening_book is not None : opening_book.check_configuration(self.configuration())
+        self.opening_book=opening_book
+
+    def compile_rules(self):
+        '''
+        Compile self.rules into the legality tables used by every agent:
+        - self.neighborhoods[x][y] : tuple of the cells a gamer in (x,y) can act upon.
+        - self.can_move_height[from_height][to_height] : whether a gamer can move between pillars of these heights.
+        - self.can_build_height[height] : whether a pillar of this height can be built up.
+        - self.goals : list of the goal cells.
+        - self.symmetries : the board symmetries which keep the goals in place, see canonical_symmetry(),
+          with the image of each cell index (self.symmetry_images) and the matching height permutation (self.symmetry_gathers).
+        - self.rollout_tables : the same tables with cells indexed by x + y*width, for rollout.py,
+          with the closest goal of each cell and the distance of each cell to each goal.
+        '''
+        rules=self.rules
+        self.neighborhoods=[[tuple(self.grid.get_neighborhood((x,y), moore=rules.moore, include_center=False))
+                             for y in range(self.grid.height)] for x in range(self.grid.width)]
+        heights=range(self.max_pillar_height+1)
+        self.can_move_height=[[-rules.max_drop <= to_height-from_height <= rules.max_climb for to_height in heights]
+                              for from_height in heights]
+        max_build_height=rules.max_build_height if rules.max_build_height is not None else self.max_pillar_height-1
+        if max_build_height >= self.max_pillar_height:
+            raise(ValueError("Pillars must not be built as high as the goal pillars."))
+        self.can_build_height=[height < max_build_height for height in heights]
+        # A gamer reaches a goal from a pillar it built next to it, or from the ground if it can climb that high.
+        can_build=rules.deck.get(Card.BUILD_PILLAR, 0) > 0 and max_build_height > 0
+        highest_start=max_build_height if can_build else 0
+        if rules.deck.get(Card.MOVE, 0) == 0 or highest_start+rules.max_climb < self.max_pillar_height:
+            raise(ValueError("These rules can never be won: no gamer can climb onto a goal pillar."))
+        self.goals=list(rules.goals) if rules.goals is not None else [(self.grid.width//2, self.grid.height//2)]
+        if any(self.grid.out_of_bounds(goal) for goal in self.goals):
+            raise(ValueError("Goal cells must be on the grid."))
+        self.symmetries=[symmetry for symmetry in board_symmetries(self.grid.width, self.grid.height)
+                         if set(map(symmetry, self.goals)) == set(self.goals)]
+        cells=[(x,y) for x in range(self.grid.width) for y in range(self.grid.height)] # cell of index x*height+y
+        self.symmetry_images=[]
+        self.symmetry_gathers=[]
+        for symmetry in self.symmetries:
+            images=[cells.index(symmetry(cell)) for cell in cells]
+            self.symmetry_images.append(images)
+            sources=[0]*len(cells)
+            for index, image in enumerate(images):
+                sources[image]=index
+            self.symmetry_gathers.append(itemgetter(*sources)) # heights by cell index -> heights of the image position
+        width=self.grid.width
+        self.rollout_tables=(width,
+                             tuple(tuple(cell[0]+cell[1]*width for cell in self.neighborhoods[index%width][index//width])
+                                   for index in range(width*self.grid.height)),
+                             tuple(tuple(row) for row in self.can_move_height),
+                             tuple(self.can_build_height),
+                             tuple(tuple(min(self.goals, key=lambda goal: tuple_dist((index%width, index//width), goal)) == goal
+                                         for goal in self.goals).index(True) for index in range(width*self.grid.height)),
+                             tuple(tuple(tuple_dist((index%width, index//width), goal) for index in range(width*self.grid.height))
+                                   for goal in self.goals),
+                             self.max_pillar_height)
+
+    def neighborhood(self, cell):
+        '''Cells a gamer standing in cell can act upon.'''
+        return(self.neighborhoods[cell[0]][cell[1]])
+
     def init_teams(self, player, AIs=["RANDOM", "REACTIVE"]):
         '''Initialize Teams, team decks, and team hands.'''
         if player :
-            teams=[Team(Color.RED , hand_size=self.num_gamers_per_team, ai=AIs[0]),
-                Team(Color.BLUE, hand_size=self.num_gamers_per_team, ai=None, player = True)]
+            teams=[Team(Color.RED , hand_size=self.num_gamers_per_team, ai=AIs[0], rng=self.random),
+                Team(Color.BLUE, hand_size=self.num_gamers_per_team, ai=None, player = True, rng=self.random)]
         else :
-            teams=[Team(Color.RED , hand_size=self.num_gamers_per_team, ai=AIs[0]),
-               Team(Color.BLUE, hand_size=self.num_gamers_per_team, ai=AIs[1])]
+            teams=[Team(Color.RED , hand_size=self.num_gamers_per_team, ai=AIs[0], rng=self.random),
+               Team(Color.BLUE, hand_size=self.num_gamers_per_team, ai=AIs[1], rng=self.random)]
         for team in teams:
-            #Initialize team decks
-            for _ in range(team.hand_size):
-                team.deck.append(Card.MOVE)
-                team.deck.append(Card.BUILD_PILLAR)
-            random.shuffle(team.deck)
-            #Initialize team hands
-            for _ in range(team.hand_size): #hand size is equal to the number of players per team.
-                team.hand.append(team.deck.pop())
+            self.deal_cards(team)
         return(teams)
 
+    def deal_cards(self, team):
+        '''Initialize a team's deck and hand. Any cards the team already had are thrown away.'''
+        team.deck.clear()
+        team.hand.clear()
+        team.discard.clear()
+        #Initialize team decks
+        for _ in range(team.hand_size):
+            for card, copies in self.rules.deck.items():
+                for _ in range(copies):
+                    team.add_new_card_to_deck(card)
+        self.random.shuffle(team.deck)
+        #Initialize team hands
+        for _ in range(team.hand_size): #hand size is equal to the number of players per team.
+            team.hand.append(team.deck.pop())
+
     def init_pillars(self):
         '''
         Initialize Pillars as agents and initialize pillar list.
         There is one pillar per cell.
-        All pillars are of height 0, except the central pillar which is of max height.
+        All pillars are of height 0, except the central pillar (or the goal pillars of the rules) which is of max height.
         '''
-        pillars=np.zeros((self.grid.width,self.grid.height),dtype=int).tolist()
+        pillars=[[None]*self.grid.height for _ in range(self.grid.width)]
         grid_length=self.grid.width*self.grid.height
         for unique_id in range(grid_length): # In mesa, we must add each pillar as agents to the grid to visualize them.
             pillar = PillarAgent(unique_id, self,height=0)
@@ -672,12 +991,14 @@ class GameModel(mesa.Model):
             self.grid.place_agent(pillar, (x,y))
             pillars[x][y]=pillar
         # Init central pillar    
-        pillars[self.grid.width//2][self.grid.height//2].height=self.max_pillar_height
+        for goal in self.goals:
+            pillars[goal[0]][goal[1]].height=self.max_pillar_height
         return(pillars)
 
     def init_gamerAgents(self):
         '''Initialize gamers and team initiave_queues'''
         grid_length=self.grid.width*self.grid.height
+        self.gamers=[] # gamers in creation order
         for i in range(self.num_gamers_per_team*2):
             unique_id=i+grid_length # each pillar already has a unique id, so we must give different unique ids to the gamer agents.
             
@@ -686,14 +1007,138 @@ class GameModel(mesa.Model):
             agent = GamerAgent(unique_id, self,team)
             team.initiative_queue.append(agent)
             self.schedule.add(agent)
+            self.gamers.append(agent)
+        self.place_gamerAgents()
 
-            # Add the GamerAgent to a random unoccupied grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            while len(self.grid.grid[x][y])!=1 or self.grid.grid[x][y][0].height != 0: #Check that only a pillar is there and that that pillar is of height 0
-                x = self.random.randrange(self.grid.width)
-                y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(agent, (x, y))
+    def place_gamerAgents(self):
+        '''Place each gamer on a different random cell with a pillar of height 0. The gamers must not be on the grid.'''
+        free_cells=[(x,y) for x in range(self.grid.width) for y in range(self.grid.height) if self.pillars[x][y].height == 0]
+        for agent, cell in zip(self.gamers, self.random.sample(free_cells, len(self.gamers))):
+            self.grid.place_agent(agent, cell)
+
+    def reset(self, seed=None, player=None, AI1_behaviour=None, AI2_behaviour=None,
+              rollout_playouts=None, rollout_policy=None, rollout_workers=None):
+        '''
+        Resets the model in place for a new game.
+        The grid, pillars, scheduler, teams and gamers are reused instead of being built again.
+        The player option, the AI behaviours and the rollout_ parameters can be changed (None keeps the current ones,
+        so give os.cpu_count() rollout workers for one worker per CPU),
+        the grid size, team size, pillar height and rules can't. See ModelPool to keep models of several configurations.
+        If a seed is given, the model's random generator is reseeded with it.
+        The opening book is kept, it stays valid from one game to the next.
+        '''
+        if seed is not None:
+            self.random.seed(seed) # the teams share this generator.
+            self._seed=seed
+        if player is not None : self.player=player
+        if AI1_behaviour is not None : self.AI1_behaviour=AI1_behaviour
+        if AI2_behaviour is not None : self.AI2_behaviour=AI2_behaviour
+        if rollout_playouts is not None : self.rollout_playouts=rollout_playouts
+        if rollout_policy is not None : self.rollout_policy=rollout_policy
+        if rollout_workers is not None : self.rollout_workers=rollout_workers
+        self.running=True
+
+        for column in self.pillars:
+            for pillar in column:
+                pillar.height=0
+        for goal in self.goals:
+            self.pillars[goal[0]][goal[1]].height=self.max_pillar_height
+
+        self.teams[0].set_ai(self.AI1_behaviour)
+        self.teams[1].player=self.player
+        if not self.player : self.teams[1].set_ai(self.AI2_behaviour)
+        for team in self.teams:
+            self.deal_cards(team)
+            team.clear_messages_from_pile()
+            team.initiative_queue=[agent for agent in self.gamers if agent.team is team]
+
+        for agent in self.gamers:
+            self.grid.remove_agent(agent)
+            agent.height=0
+            agent.initiative=0
+        self.place_gamerAgents()
+        self.update_initiatives()
+        self.schedule.steps=0
+        self.schedule.time=0
+
+        self.datacollector = mesa.DataCollector(
+            model_reporters={},
+            agent_reporters={}
+        )
+
+    def canonical_symmetry(self, team=None, agent=None, with_hand=False, any_team=False):
+        '''
+        Returns (canonical_state, symmetry), where symmetry is the board symmetry which maps the current
+        position onto its canonical state.
+
+        The state is written from the point of view of a team (self.teams[0] by default):
+        (sorted ally cells, sorted foe cells, agent cell and height, hand, pillar heights),
+        with cells as indexes x*height+y.
+        Allies come first and foes second, so a position seen by red and the same position with the red and blue
+        teams swapped seen by blue share the same canonical state: pass the side to move as team.
+        With the default team, the swapped position has another state.
+        The canonical state is the smallest of the states obtained by applying every board symmetry,
+        so the 8 symmetric positions of a square board share it.
+        The gamer cells are compared first, so the pillar heights are only mapped by the symmetries tied on them.
+
+        If an agent is given, its cell and its height attribute are part of the state.
+        If with_hand is True, the team's hand is part of the state.
+        If any_team is True, team is ignored and the state is the smallest of the states seen by each team,
+        so a position and its team swapped copy share it whatever the side to move. Use it to deduplicate game records.
+        The canonical state is hashable, so it can be used as a key of the opening book or of a set of game records.
+        '''
+        if any_team:
+            return(min((self.canonical_symmetry(team, agent, with_hand) for team in self.teams), key=itemgetter(0)))
+        if team is None : team=self.teams[0]
+        height=self.grid.height
+        allies=[ally.pos[0]*height+ally.pos[1] for ally in team.initiative_queue]
+        foes=[foe.pos[0]*height+foe.pos[1] for other_team in self.teams if other_team is not team for foe in other_team.initiative_queue]
+        hand=tuple(sorted(card.name for card in team.hand)) if with_hand else ()
+        best_cells, tied = None, []
+        for index, images in enumerate(self.symmetry_images):
+            cells=(tuple(sorted([images[cell] for cell in allies])),
+                   tuple(sorted([images[cell] for cell in foes])),
+                   (images[agent.pos[0]*height+agent.pos[1]], agent.height) if agent is not None else ())
+            if best_cells is None or cells < best_cells:
+                best_cells, tied = cells, [index]
+            elif cells == best_cells:
+                tied.append(index)
+        heights=[pillar.height for column in self.pillars for pillar in column]
+        best_heights, best_index = None, None
+        for index in tied:
+            image_heights=self.symmetry_gathers[index](heights)
+            if best_heights is None or image_heights < best_heights:
+                best_heights, best_index = image_heights, index
+        return(best_cells+(hand, best_heights), self.symmetries[best_index])
+
+    def canonical_state(self, team=None, agent=None, with_hand=False, any_team=False):
+        '''Returns the canonical state of the current position. See canonical_symmetry().'''
+        return(self.canonical_symmetry(team, agent, with_hand, any_team)[0])
+
+    def rollout_state(self, agent):
+        '''
+        Encodes the position just before agent acts as a numpy int32 array, for rollout.py.
+        Teams are written from the agent's point of view, allies first. Cells are indexed by x + y*width.
+        Layout:
+        - width, height, num_gamers_per_team, 0 if the allies are self.teams[0] else 1
+        - width*height pillar heights
+        - the cells of the allies then of the foes, in initiative queue order. This numbers the gamers.
+        - for the allies then the foes: hand, deck and discard pile, as card counts in rollout_cards order
+        - the agent's number, the number of gamers still to act this turn after it, and their numbers
+        '''
+        width, height = self.grid.width, self.grid.height
+        foes=[team for team in self.teams if team is not agent.team][0]
+        gamers=agent.team.initiative_queue+foes.initiative_queue
+        state=[width, height, self.num_gamers_per_team, 0 if self.teams[0] is agent.team else 1]
+        state+=[self.pillars[index%width][index//width].height for index in range(width*height)]
+        state+=[gamer.pos[0]+gamer.pos[1]*width for gamer in gamers]
+        for team in (agent.team, foes):
+            for pile in (team.hand, team.deck, team.discard):
+                state+=[pile.count(card) for card in self.rollout_cards]
+        scheduled=self.schedule.agents
+        pending=scheduled[scheduled.index(agent)+1:]
+        state+=[gamers.index(agent), len(pending)]+[gamers.index(gamer) for gamer in pending]
+        return(np.array(state, dtype=np.int32))
 
     def update_initiatives(self):
         '''
@@ -715,3 +1160,47 @@ class GameModel(mesa.Model):
         self.datacollector.collect(self)
         self.update_initiatives()
         self.schedule.step()
+
+
+class ModelPool:
+    """
+    A pool of pre-built GameModels, kept per configuration (team size, grid size, pillar height, rules).
+    Building a model creates a grid, a pillar agent per cell, a scheduler, teams and gamers.
+    For tournaments of short games, acquire() instead hands out a model from the pool, reset in place for a new game,
+    and only builds a new model if the pool has none of that configuration.
+    Give the models back with release() once their game is over.
+    """
+
+    def __init__(self):
+        self.free_models={} # configuration -> list of models
+
+    @staticmethod
+    def configuration(model):
+        return(model.configuration())
+
+    def fill(self, count, num_gamers_per_team, width, height, max_pillar_height=7, rules=None):
+        '''Builds count models of a configuration ahead of time.'''
+        for _ in range(count):
+            self.release(GameModel(num_gamers_per_team, width, height, False, "RANDOM", "RANDOM", max_pillar_height, rules=rules))
+
+    def acquire(self, num_gamers_per_team, width, height, player, AI1_behaviour, AI2_behaviour, max_pillar_height=7,
+                opening_book=None, seed=None, rules=None, rollout_playouts=32, rollout_policy="REACTIVE", rollout_workers=None):
+        '''Returns a model ready for a new game. Takes the same arguments as GameModel().'''
+        configuration=(num_gamers_per_team, width, height, max_pillar_height, (rules if rules is not None else RuleSet()).signature())
+        free_models=self.free_models.get(configuration)
+        if not free_models:
+            return(GameModel(num_gamers_per_team, width, height, player, AI1_behaviour, AI2_behaviour, max_pillar_height,
+                             opening_book=opening_book, seed=seed, rules=rules, rollout_playouts=rollout_playouts,
+                             rollout_policy=rollout_policy, rollout_workers=rollout_workers))
+        # Check the book before taking a model, so that a wrong book doesn't lose it.
+        if isinstance(opening_book, str) : opening_book=OpeningBook.load(opening_book)
+        if opening_book is not None : opening_book.check_configuration(configuration)
+        model=free_models.pop()
+        model.reset(seed, player, AI1_behaviour, AI2_behaviour, rollout_playouts, rollout_policy,
+                    rollout_workers if rollout_workers is not None else os.cpu_count())
+        model.set_opening_book(opening_book)
+        return(model)
+
+    def release(self, model):
+        '''Gives a model back to the pool.'''
+        self.free_models.setdefault(self.configuration(model), []).append(model)
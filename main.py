@@ -26,9 +26,9 @@ def run_single_server(grid_size=5):
          "width": grid_size,
          "height": grid_size,
          "AI1_behaviour" : UserSettableParameter('choice', 'Red AI behaviour', value='RANDOM',
-                                          choices=["RANDOM", "REACTIVE", "UTILITY"]),
+                                          choices=["RANDOM", "REACTIVE", "UTILITY", "ROLLOUT"]),
          "AI2_behaviour" : UserSettableParameter('choice', 'Blue AI behaviour', value='REACTIVE',
-                                          choices=['RANDOM', 'REACTIVE', 'UTILITY']),
+                                          choices=['RANDOM', 'REACTIVE', 'UTILITY', 'ROLLOUT']),
          "player" : UserSettableParameter('checkbox', 'Human player ? (BLUE)', value=False),
          } # Model parameters
     )
@@ -0,0 +1,292 @@
+'''
+Monte-Carlo rollouts for the ROLLOUT AI.
+
+A rollout plays a candidate action then plays the game to the end with fast RANDOM or REACTIVE playouts.
+Playouts don't use mesa: they run on flat lists, with cells indexed by x + y*width.
+They are spread across a pool of worker processes (see RolloutPool), one pool per number of workers whatever the rules.
+Each worker reads the compiled rules (see GameModel.compile_rules()) once per set of rules, and each root position
+(see GameModel.rollout_state() for its layout) from shared memory blocks instead of unpickling a GameModel.
+
+Scores are seen from the acting team: 1 for a win, 0 for a loss, 0.5 for a game unfinished after max_rounds.
+'''
+import atexit
+import os
+import pickle
+import random
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Card codes. GameModel.rollout_cards gives the matching Cards.
+MOVE=0
+BUILD_PILLAR=1
+NUM_CARDS=2
+
+NO_CELL=-1 # A candidate with NO_CELL uses its card as an initiative setter.
+
+class Playout:
+    """
+    A fast copy of a game position, which plays the game with a RANDOM or REACTIVE policy for every gamer.
+    Gamers are numbered by team then by initiative at the root : allies are 0..n-1, foes n..2n-1.
+    The hidden order of the decks is reshuffled for every playout.
+    """
+
+    def __init__(self, state, tables, rng):
+        (self.width, self.neighbors, self.can_move_height, self.can_build_height,
+         self.closest_goal, self.goal_distances, self.max_height) = tables
+        self.rng=rng
+        width, height, self.n, first_team = state[0:4]
+        self.team_order=(0,1) if first_team == 0 else (1,0)
+        cells=width*height
+        i=4
+        self.heights=state[i:i+cells]
+        i+=cells
+        self.pos=state[i:i+2*self.n]
+        i+=2*self.n
+        self.occupied=[False]*cells
+        for cell in self.pos:
+            self.occupied[cell]=True
+        self.hands, self.decks, self.discards = [], [], []
+        for _ in range(2):
+            for piles in (self.hands, self.decks, self.discards):
+                counts=state[i:i+NUM_CARDS]
+                piles.append([card for card in range(NUM_CARDS) for _ in range(counts[card])])
+                i+=NUM_CARDS
+        for deck in self.decks:
+            rng.shuffle(deck)
+        self.actor=state[i]
+        self.pending=state[i+2:i+2+state[i+1]]
+        self.queues=[list(range(self.n)), list(range(self.n, 2*self.n))]
+
+    def team(self, gamer):
+        return(gamer//self.n)
+
+    def can_move(self, gamer, cell):
+        return(not self.occupied[cell] and self.can_move_height[self.heights[self.pos[gamer]]][self.heights[cell]])
+
+    def can_build(self, cell):
+        return(not self.occupied[cell] and self.can_build_height[self.heights[cell]])
+
+    def act(self, gamer, card, cell):
+        '''Plays a card, on a cell or as an initiative setter. Returns True if the gamer won.'''
+        team=self.team(gamer)
+        self.hands[team].remove(card)
+        self.discards[team].append(card)
+        if cell == NO_CELL:
+            self.queues[team].remove(gamer)
+            self.queues[team].insert(0, gamer)
+        elif card == MOVE:
+            self.occupied[self.pos[gamer]]=False
+            self.occupied[cell]=True
+            self.pos[gamer]=cell
+        else:
+            self.heights[cell]+=1
+        return(self.heights[self.pos[gamer]] == self.max_height)
+
+    def draw_new_hand(self, team):
+        hand, deck, discard = self.hands[team], self.decks[team], self.discards[team]
+        while len(hand) < self.n:
+            if len(deck) == 0:
+                deck.extend(discard)
+                discard.clear()
+                self.rng.shuffle(deck)
+            else:
+                hand.append(deck.pop())
+
+    def random_action(self, gamer):
+        card=self.rng.choice(self.hands[self.team(gamer)])
+        if card == MOVE:
+            cells=[cell for cell in self.neighbors[self.pos[gamer]] if self.can_move(gamer, cell)]
+        else:
+            cells=[cell for cell in self.neighbors[self.pos[gamer]] if self.can_build(cell)]
+        return(card, self.rng.choice(cells) if cells else NO_CELL)
+
+    def reactive_action(self, gamer):
+        '''Same priorities as GamerAgent.reactive_AI().'''
+        hand=self.hands[self.team(gamer)]
+        pos=self.pos[gamer]
+        heights=self.heights
+        own_height=heights[pos]
+        can_move_height=self.can_move_height[own_height]
+        goal_distance=self.goal_distances[self.closest_goal[pos]]
+        advantageous, upgradable, lower, same_level = [], [], [], []
+        for cell in self.neighbors[pos]:
+            if self.occupied[cell]:
+                continue
+            height=heights[cell]
+            height_diff=height-own_height
+            if can_move_height[height]:
+                if height_diff == 1 : advantageous.append(cell)
+                elif height_diff == 0 : same_level.append(cell)
+            if self.can_build_height[height]:
+                if height_diff == 0 : upgradable.append(cell)
+                elif height_diff < 0 : lower.append(cell)
+        for card, cells in ((MOVE, advantageous), (BUILD_PILLAR, upgradable), (BUILD_PILLAR, lower), (MOVE, same_level)):
+            if cells and card in hand:
+                min_dist=min(goal_distance[cell] for cell in cells)
+                return(card, self.rng.choice([cell for cell in cells if goal_distance[cell] == min_dist]))
+        return(self.rng.choice(hand), NO_CELL)
+
+    def play(self, candidate, policy, max_rounds):
+        '''Plays the candidate action for the actor, then the game to the end. Returns the acting team's score.'''
+        choose_action=self.reactive_action if policy == "REACTIVE" else self.random_action
+        if self.act(self.actor, *candidate):
+            return(1.0)
+        turns=list(self.pending)
+        for _ in range(max_rounds+1):
+            for gamer in turns:
+                team=self.team(gamer)
+                if len(self.hands[team]) == 0 : self.draw_new_hand(team)
+                if self.act(gamer, *choose_action(gamer)):
+                    return(1.0 if team == 0 else 0.0)
+            turns=[self.queues[team][i] for i in range(self.n) for team in self.team_order]
+        return(0.5)
+
+def run_playouts(state, tables, candidate, playouts, policy, seed, max_rounds):
+    '''Returns the total score of a candidate over a number of playouts.'''
+    rng=random.Random(seed)
+    return(sum(Playout(list(state), tables, rng).play(candidate, policy, max_rounds) for _ in range(playouts)))
+
+# Worker process state : the last rule tables and shared memory blocks read by this worker.
+worker_tables=None
+worker_tables_name=None
+worker_memory=None
+
+def read_tables(tables_name):
+    '''Returns the rule tables written by RolloutPool.write_tables(), only unpickled when they change.'''
+    global worker_tables, worker_tables_name
+    if worker_tables_name != tables_name:
+        memory=shared_memory.SharedMemory(name=tables_name)
+        length=int.from_bytes(memory.buf[:8], "little")
+        worker_tables=pickle.loads(bytes(memory.buf[8:8+length]))
+        worker_tables_name=tables_name
+        memory.close()
+    return(worker_tables)
+
+def run_shared_playouts(shm_name, tables_name, batch, playouts, policy, max_rounds):
+    '''
+    Worker side of RolloutPool.evaluate() : returns the total score of each (candidate, seed) of the batch,
+    reading the root position and the rule tables from the pool's shared memory blocks.
+    The position block is attached once per worker, the tables are read once per worker and set of tables.
+    '''
+    global worker_memory
+    tables=read_tables(tables_name)
+    if worker_memory is None or worker_memory.name != shm_name:
+        if worker_memory is not None : worker_memory.close()
+        worker_memory=shared_memory.SharedMemory(name=shm_name)
+    view=np.ndarray((worker_memory.size//4,), dtype=np.int32, buffer=worker_memory.buf)
+    state=view[1:1+int(view[0])].tolist()
+    del view # the buffer can't be closed while a numpy array uses it.
+    return([run_playouts(state, tables, candidate, playouts, policy, seed, max_rounds) for candidate, seed in batch])
+
+class RolloutPool:
+    """
+    A pool of worker processes running playouts, shared by every set of compiled rules.
+    The current rule tables are pickled in a shared memory block, replaced only when a decision uses other tables.
+    Workers keep the tables of the block they last read, so each worker unpickles a set of tables once,
+    and again only after a decision with other rules.
+    Root positions are written in another shared memory block which belongs to the pool and is reused for every decision,
+    so each decision only sends the names of the blocks and a batch of candidates to each worker.
+    A pool isn't thread safe : one decision is evaluated at a time.
+    """
+
+    def __init__(self, workers):
+        self.workers=workers
+        self.executor=ProcessPoolExecutor(max_workers=workers)
+        self.shm=None
+        self.tables=None
+        self.tables_shm=None
+
+    def write_tables(self, tables):
+        '''Writes the rule tables in a new shared memory block, as their pickled length followed by their pickle, if they changed.'''
+        if tables is self.tables or tables == self.tables:
+            return
+        data=pickle.dumps(tables)
+        self.close_tables()
+        self.tables_shm=shared_memory.SharedMemory(create=True, size=len(data)+8)
+        self.tables_shm.buf[:8]=len(data).to_bytes(8, "little")
+        self.tables_shm.buf[8:8+len(data)]=data
+        self.tables=tables
+
+    def write_state(self, state):
+        '''Writes the root position in the shared memory block, as its length followed by the position.'''
+        size=(len(state)+1)*4
+        if self.shm is None or self.shm.size < size:
+            self.close_memory()
+            self.shm=shared_memory.SharedMemory(create=True, size=max(size, 4096))
+        view=np.ndarray((len(state)+1,), dtype=np.int32, buffer=self.shm.buf)
+        view[0]=len(state)
+        view[1:]=state
+        del view
+
+    def evaluate(self, state, tables, candidates, playouts, policy, seed, max_rounds):
+        '''Returns the total score of each candidate. Candidate i is played out with the seed seed+i.'''
+        self.write_tables(tables)
+        self.write_state(state)
+        seeded=[(candidate, seed+i) for i, candidate in enumerate(candidates)]
+        batches=[seeded[i::self.workers] for i in range(min(self.workers, len(seeded)))]
+        futures=[self.executor.submit(run_shared_playouts, self.shm.name, self.tables_shm.name, batch, playouts, policy, max_rounds)
+                 for batch in batches]
+        scores=[0.0]*len(candidates)
+        for i, future in enumerate(futures):
+            scores[i::self.workers]=future.result()
+        return(scores)
+
+    def close_memory(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm=None
+
+    def close_tables(self):
+        if self.tables_shm is not None:
+            self.tables_shm.close()
+            self.tables_shm.unlink()
+            self.tables_shm=None
+            self.tables=None
+
+    def close(self):
+        self.executor.shutdown()
+        self.close_memory()
+        self.close_tables()
+
+pools={} # number of workers -> RolloutPool
+
+def get_pool(workers):
+    '''Returns the pool of this size, started on first use and shared by every model, whatever its rules.'''
+    if workers not in pools:
+        pools[workers]=RolloutPool(workers)
+    return(pools[workers])
+
+def close_pool(workers):
+    '''Stops the pool of this size, if it is running.'''
+    pool=pools.pop(workers, None)
+    if pool is not None : pool.close()
+
+@atexit.register
+def close_pools():
+    '''Stops the worker processes and frees the shared memory blocks.'''
+    for workers in list(pools):
+        close_pool(workers)
+
+def evaluate_candidates(state, tables, candidates, playouts=32, policy="REACTIVE", workers=None, seed=0, max_rounds=100):
+    '''
+    Returns the mean score of each candidate (card, cell) action over a number of playouts.
+    state is the root position, a numpy int32 array. workers is the size of the process pool,
+    None for one worker per CPU. With 0 or 1 worker the playouts are run in this process,
+    as a single worker process would only add the cost of sending it the work.
+    The scores only depend on the seed, not on the number of workers.
+    '''
+    if workers is None : workers=os.cpu_count()
+    if workers <= 1:
+        state=state.tolist()
+        scores=[run_playouts(state, tables, candidate, playouts, policy, seed+i, max_rounds) for i, candidate in enumerate(candidates)]
+    else:
+        try:
+            scores=get_pool(workers).evaluate(state, tables, candidates, playouts, policy, seed, max_rounds)
+        except BrokenProcessPool:
+            close_pool(workers) # the next decision starts a new pool instead of reusing the broken one.
+            raise
+    return([score/playouts for score in scores])
@@ -0,0 +1,161 @@
+import pytest
+
+from game_model import Card, GameModel, ModelPool, RuleSet
+
+def play(model, max_steps=40):
+    '''Plays a game and returns the sequence of positions, hands and decks after each step.'''
+    trajectory=[]
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+        trajectory.append((tuple(agent.pos for agent in model.gamers),
+                           tuple(pillar.height for column in model.pillars for pillar in column),
+                           tuple((tuple(team.hand), tuple(team.deck), tuple(team.discard)) for team in model.teams)))
+    return(trajectory)
+
+def test_seeded_models_play_the_same_game():
+    games=[play(GameModel(2, 7, 7, False, "RANDOM", "REACTIVE", 5, seed=7)) for _ in range(2)]
+    assert games[0] == games[1]
+
+def test_reset_with_a_seed_replays_the_same_game():
+    model=GameModel(2, 7, 7, False, "RANDOM", "REACTIVE", 5)
+    games=[]
+    for _ in range(2):
+        model.reset(seed=42)
+        decks=[list(team.deck) for team in model.teams]
+        games.append((decks, play(model)))
+    assert games[0] == games[1]
+    assert games[0][1] == play(GameModel(2, 7, 7, False, "RANDOM", "REACTIVE", 5, seed=42))
+
+def test_reset_restores_the_initial_state():
+    model=GameModel(2, 5, 5, False, "REACTIVE", "REACTIVE", 5, seed=1)
+    play(model)
+    model.reset(seed=2)
+    assert model.running
+    assert model.schedule.steps == 0
+    heights=[pillar.height for column in model.pillars for pillar in column]
+    assert sorted(heights) == [0]*24 + [5]
+    for team in model.teams:
+        assert len(team.hand) == 2 and len(team.deck) == 2 and team.discard == []
+        assert len(team.initiative_queue) == 2
+    assert len({agent.pos for agent in model.gamers}) == 4
+
+def test_model_pool_reuses_released_models():
+    pool=ModelPool()
+    model=pool.acquire(2, 5, 5, False, "RANDOM", "RANDOM", 5)
+    pool.release(model)
+    assert pool.acquire(2, 5, 5, False, "REACTIVE", "RANDOM", 5, seed=3) is model
+    assert pool.acquire(2, 5, 5, False, "REACTIVE", "RANDOM", 5) is not model
+
+def transform(model, symmetry):
+    '''Applies a board symmetry to the whole position of a model.'''
+    heights={symmetry((x,y)): pillar.height for x, column in enumerate(model.pillars) for y, pillar in enumerate(column)}
+    for (x,y), height in heights.items():
+        model.pillars[x][y].height=height
+    cells=[symmetry(agent.pos) for agent in model.gamers]
+    for agent in model.gamers:
+        model.grid.remove_agent(agent)
+    for agent, cell in zip(model.gamers, cells):
+        model.grid.place_agent(agent, cell)
+
+def test_canonical_state_is_invariant_under_board_symmetries():
+    model=GameModel(2, 7, 7, False, "REACTIVE", "RANDOM", 5, seed=5)
+    play(model, max_steps=6)
+    agent=model.gamers[0]
+    state=model.canonical_state(agent.team, agent, with_hand=True)
+    assert len(model.symmetries) == 8
+    for symmetry in model.symmetries:
+        transform(model, symmetry)
+        assert model.canonical_state(agent.team, agent, with_hand=True) == state
+        # Every board symmetry s verifies s^4 = identity: go back to the original position.
+        for _ in range(3):
+            transform(model, symmetry)
+
+def test_canonical_state_is_invariant_under_team_swap():
+    model=GameModel(1, 5, 5, False, "REACTIVE", "RANDOM", 5, seed=3)
+    play(model, max_steps=3)
+    red, blue = model.gamers
+    state=model.canonical_state(model.teams[0])
+    red_cell, blue_cell = red.pos, blue.pos
+    model.grid.move_agent(red, (0,0) if blue_cell != (0,0) else (0,1))
+    model.grid.move_agent(blue, red_cell)
+    model.grid.move_agent(red, blue_cell)
+    assert model.canonical_state(model.teams[1]) == state
+    assert model.canonical_state(model.teams[0]) != state
+
+def test_deduplication_state_is_invariant_under_team_swap():
+    model=GameModel(2, 5, 5, False, "REACTIVE", "RANDOM", 5, seed=3)
+    play(model, max_steps=3)
+    state=model.canonical_state(any_team=True)
+    assert state == min(model.canonical_state(team) for team in model.teams)
+    red_state=model.canonical_state()
+    red_cells=[agent.pos for agent in model.teams[0].initiative_queue]
+    blue_cells=[agent.pos for agent in model.teams[1].initiative_queue]
+    for agent in model.gamers:
+        model.grid.remove_agent(agent)
+    # The red gamers take the cells of the blue gamers and the other way around.
+    for team, cells in zip(model.teams, [blue_cells, red_cells]):
+        for agent, cell in zip(team.initiative_queue, cells):
+            model.grid.place_agent(agent, cell)
+    assert model.canonical_state() != red_state
+    assert model.canonical_state(any_team=True) == state
+
+def test_symmetries_keep_the_goals_in_place():
+    model=GameModel(1, 7, 7, False, "RANDOM", "RANDOM", 5, rules=RuleSet(goals=[(0,0),(6,6)]))
+    assert len(model.symmetries) == 4
+
+def test_rule_signature_does_not_depend_on_deck_order():
+    rules=RuleSet(deck={Card.BUILD_PILLAR: 1, Card.MOVE: 1})
+    assert rules.signature() == RuleSet().signature()
+    pool=ModelPool()
+    pool.release(GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5))
+    assert pool.acquire(1, 5, 5, False, "RANDOM", "RANDOM", 5, rules=rules).rules.signature() == RuleSet().signature()
+    assert pool.free_models[ModelPool.configuration(GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5))] == []
+
+def test_rule_signature_does_not_depend_on_goal_order_or_empty_cards():
+    rules=RuleSet(goals=[[4,4], (0,0), (4,4)])
+    assert rules.signature() == RuleSet(goals=[(0,0),(4,4)]).signature()
+    assert RuleSet(deck={Card.MOVE: 2, Card.BUILD_PILLAR: 0}).signature() == RuleSet(deck={Card.MOVE: 2}).signature()
+    pool=ModelPool()
+    model=GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5, rules=RuleSet(goals=[(4,4),(0,0)]))
+    pool.release(model)
+    assert pool.acquire(1, 5, 5, False, "RANDOM", "RANDOM", 5, rules=rules) is model
+
+@pytest.mark.parametrize("rules", [RuleSet(max_build_height=2), RuleSet(deck={Card.BUILD_PILLAR: 1}),
+                                   RuleSet(deck={Card.MOVE: 1}), RuleSet(max_climb=0)])
+def test_rules_which_can_never_be_won_are_rejected(rules):
+    with pytest.raises(ValueError):
+        GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5, rules=rules)
+
+def test_rule_variants_can_be_won():
+    for rules in [RuleSet(moore=True), RuleSet(max_climb=2, max_drop=3), RuleSet(goals=[(1,1),(3,3)])]:
+        model=GameModel(1, 5, 5, False, "REACTIVE", "REACTIVE", 5, seed=0, rules=rules)
+        play(model, max_steps=200)
+        assert not model.running
+    # REACTIVE only climbs one level at a time, so these are won by ROLLOUT, which plays every legal move.
+    for rules, highest_start in [(RuleSet(max_build_height=3, max_climb=2), 3), (RuleSet(deck={Card.MOVE: 1}, max_climb=5), 0)]:
+        model=GameModel(1, 5, 5, False, "ROLLOUT", "ROLLOUT", 5, seed=3, rules=rules, rollout_playouts=8, rollout_workers=0)
+        assert model.can_move_height[highest_start][5]
+        play(model, max_steps=200)
+        assert not model.running
+
+def test_player_can_play_diagonally_with_moore_rules(monkeypatch):
+    model=GameModel(1, 5, 5, True, "RANDOM", "RANDOM", 5, seed=0, rules=RuleSet(moore=True))
+    red, blue = model.gamers
+    model.grid.move_agent(red, (4,4))
+    model.grid.move_agent(blue, (0,0))
+    # The only cell the blue gamer can act upon is the diagonal one: the others are too high to climb or build.
+    model.pillars[0][1].height=4
+    model.pillars[1][0].height=4
+    blue.team.hand=[Card.MOVE, Card.MOVE]
+    monkeypatch.setattr("builtins.input", lambda prompt: "move up-right")
+    assert blue.player() == Card.MOVE
+    assert blue.pos == (1,1)
+
+def test_model_pool_applies_the_rollout_settings():
+    pool=ModelPool()
+    pool.fill(1, 1, 5, 5, 5)
+    model=pool.acquire(1, 5, 5, False, "ROLLOUT", "RANDOM", 5, rollout_playouts=4, rollout_policy="RANDOM", rollout_workers=0)
+    assert (model.rollout_playouts, model.rollout_policy, model.rollout_workers) == (4, "RANDOM", 0)
+    pool.release(model)
+    assert pool.acquire(1, 5, 5, False, "ROLLOUT", "RANDOM", 5) is model
+    assert (model.rollout_playouts, model.rollout_policy) == (32, "REACTIVE") and model.rollout_workers >= 1
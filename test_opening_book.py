@@ -0,0 +1,65 @@
+import argparse
+
+import pytest
+
+from build_opening_book import best_actions, build_opening_book
+from game_model import Card, GameModel, ModelPool, OpeningBook, RuleSet
+
+def build(seed=0, positions=3):
+    args=argparse.Namespace(grid_size=5, num_gamers_per_team=1, max_pillar_height=5, positions=positions, turns=1,
+                            playouts=4, policy="REACTIVE", workers=0, min_plays=4, seed=seed)
+    return(build_opening_book(args))
+
+def test_built_book_has_an_entry_per_position():
+    book=build(positions=3)
+    # Each opening has one position per gamer, two random openings are almost never equivalent.
+    assert len(book) == 6
+    assert book.configuration == GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5).configuration()
+
+def test_best_action_only_considers_actions_played_enough():
+    stats={1: {(Card.MOVE, (0,1)): [2.0, 2], (Card.BUILD_PILLAR, None): [5.0, 10]},
+           2: {(Card.MOVE, (0,1)): [1.0, 1]}}
+    assert best_actions(stats, min_plays=3) == {1: (Card.BUILD_PILLAR, None)}
+
+def test_saved_book_reloads_with_its_header(tmp_path):
+    book=build()
+    path=str(tmp_path/"book.bin")
+    book.save(path)
+    loaded=OpeningBook.load(path)
+    assert loaded.max_turns == book.max_turns == 1
+    assert loaded.configuration == book.configuration
+    assert loaded.entries.tolist() == book.entries.tolist()
+    empty=OpeningBook.from_actions({}, book.configuration, 3)
+    empty.save(path)
+    assert len(OpeningBook.load(path)) == 0 and OpeningBook.load(path).max_turns == 3
+
+def test_book_of_another_configuration_is_rejected(tmp_path):
+    path=str(tmp_path/"book.bin")
+    build().save(path)
+    with pytest.raises(ValueError):
+        GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5, opening_book=path, rules=RuleSet(moore=True))
+    with pytest.raises(ValueError):
+        GameModel(2, 5, 5, False, "RANDOM", "RANDOM", 5, opening_book=path)
+    pool=ModelPool()
+    pool.fill(1, 1, 7, 7, 5)
+    with pytest.raises(ValueError):
+        pool.acquire(1, 7, 7, False, "RANDOM", "RANDOM", 5, opening_book=path)
+    GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5, opening_book=path)
+
+def test_book_is_played_in_the_positions_it_was_built_from():
+    book=build(seed=4, positions=1)
+    model=GameModel(1, 5, 5, False, "RANDOM", "RANDOM", 5, opening_book=book, seed=4)
+    agent=model.schedule.agents[0]
+    agent.team.draw_new_hand()
+    state, _ = model.canonical_symmetry(team=agent.team, agent=agent, with_hand=True)
+    assert book.lookup(state) is not None
+    assert agent.opening_book_action() is not None
+
+def test_model_pool_keeps_its_model_when_the_book_is_rejected(tmp_path):
+    path=str(tmp_path/"book.bin")
+    OpeningBook.from_actions({}, GameModel(2, 5, 5, False, "RANDOM", "RANDOM", 5).configuration(), 1).save(path)
+    pool=ModelPool()
+    pool.fill(1, 1, 5, 5, 5)
+    with pytest.raises(ValueError):
+        pool.acquire(1, 5, 5, False, "RANDOM", "RANDOM", 5, opening_book=path)
+    assert len(pool.free_models[(1, 5, 5, 5, RuleSet().signature())]) == 1
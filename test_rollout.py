@@ -0,0 +1,74 @@
+import multiprocessing
+import random
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import rollout
+from game_model import GameModel, RuleSet
+
+def root_position(seed=0, rules=None):
+    model=GameModel(2, 5, 5, False, "ROLLOUT", "REACTIVE", 5, seed=seed, rules=rules)
+    agent=model.schedule.agents[0]
+    candidates=[(rollout.MOVE, rollout.NO_CELL), (rollout.BUILD_PILLAR, rollout.NO_CELL)]
+    candidates=[candidate for candidate in candidates if model.rollout_cards[candidate[0]] in agent.team.hand]
+    return(model, agent, candidates)
+
+def test_playout_reads_the_model_position():
+    model, agent, _ = root_position()
+    playout=rollout.Playout(model.rollout_state(agent).tolist(), model.rollout_tables, random.Random(0))
+    width=model.grid.width
+    assert playout.heights == [model.pillars[index%width][index//width].height for index in range(25)]
+    gamers=agent.team.initiative_queue+[gamer for gamer in model.gamers if gamer.team is not agent.team]
+    assert playout.pos == [gamer.pos[0]+gamer.pos[1]*width for gamer in gamers]
+    assert gamers[playout.actor] is agent
+    assert [gamers[gamer] for gamer in playout.pending] == model.schedule.agents[1:]
+
+def test_pool_scores_match_in_process_scores():
+    model, agent, candidates = root_position()
+    state=model.rollout_state(agent)
+    in_process=rollout.evaluate_candidates(state, model.rollout_tables, candidates, playouts=8, workers=0, seed=3)
+    pooled=rollout.evaluate_candidates(state, model.rollout_tables, candidates, playouts=8, workers=2, seed=3)
+    assert pooled == in_process
+    assert all(0 <= score <= 1 for score in pooled)
+
+def test_pool_reuses_its_shared_memory_block():
+    model, agent, candidates = root_position()
+    pool=rollout.get_pool(2)
+    rollout.evaluate_candidates(model.rollout_state(agent), model.rollout_tables, candidates, playouts=2, workers=2)
+    name=pool.shm.name
+    rollout.evaluate_candidates(model.rollout_state(agent), model.rollout_tables, candidates, playouts=2, workers=2, seed=1)
+    assert pool.shm.name == name
+    rollout.close_pools()
+    assert pool.shm is None
+
+def test_one_pool_serves_every_rule_set():
+    scores=[]
+    for rules in [RuleSet(), RuleSet(moore=True), RuleSet(max_climb=2), RuleSet()]:
+        model, agent, candidates = root_position(rules=rules)
+        state=model.rollout_state(agent)
+        pooled=rollout.evaluate_candidates(state, model.rollout_tables, candidates, playouts=4, workers=2, seed=5)
+        assert pooled == rollout.evaluate_candidates(state, model.rollout_tables, candidates, playouts=4, workers=0, seed=5)
+    assert list(rollout.pools) == [2]
+    assert len(multiprocessing.active_children()) == 2
+    rollout.close_pools()
+    assert multiprocessing.active_children() == []
+
+def test_broken_pool_is_dropped():
+    model, agent, candidates = root_position()
+    pool=rollout.get_pool(2)
+    rollout.evaluate_candidates(model.rollout_state(agent), model.rollout_tables, candidates, playouts=2, workers=2)
+    for process in multiprocessing.active_children():
+        process.kill()
+        process.join()
+    with pytest.raises(BrokenProcessPool):
+        rollout.evaluate_candidates(model.rollout_state(agent), model.rollout_tables, candidates, playouts=2, workers=2)
+    assert 2 not in rollout.pools and pool.shm is None
+    assert rollout.evaluate_candidates(model.rollout_state(agent), model.rollout_tables, candidates, playouts=2, workers=2)
+    rollout.close_pools()
+
+def test_rollout_AI_plays_a_game():
+    model=GameModel(2, 5, 5, False, "ROLLOUT", "REACTIVE", 5, seed=2, rollout_playouts=8, rollout_workers=0)
+    while model.running and model.schedule.steps < 100:
+        model.step()
+    assert not model.running